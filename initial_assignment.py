@@ -1,7 +1,8 @@
 """Initial schedule assignment using OR-Tools."""
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, List, Set, Tuple
 
+import numpy as np
 import pandas as pd
 from ortools.sat.python import cp_model
 
@@ -12,13 +13,90 @@ from utils.constants import (
     REQUEST_CSV_PATH,
     SHIFT_CODE,
     SOLVER_TIMEOUT,
+    SOLVER_NUM_WORKERS,
+    month_weekdays,
+    second_thursday,
 )
-from utils.reader import load_request_csv, parse_shift_requests
+from utils.reader import load_shift_requests
 
 
 BoolVar = cp_model.IntVar
 
 
+def holiday_forbidden_shifts(num_days: int) -> Set[Tuple[int, int]]:
+    """Return the ``(day, shift_index)`` pairs closed by clinic holidays (H3).
+
+    Thursdays and Sundays only allow night, holiday duty and rest codes;
+    Saturdays are half days without outpatient or ward shifts.
+    """
+    weekdays = month_weekdays(num_days)
+    closed_allowed = {"夜", "早日", "残日", "休", "×"}
+    saturday_banned = {"1", "2", "3", "4", "CT", "F", "2/", "〇"}
+    forbidden: Set[Tuple[int, int]] = set()
+    for d in range(1, num_days + 1):
+        wd = weekdays[d - 1]
+        for s, code in enumerate(SHIFT_TYPES):
+            if wd in ("木", "日") and code not in closed_allowed:
+                forbidden.add((d, s))
+            elif wd == "土" and code in saturday_banned:
+                forbidden.add((d, s))
+    return forbidden
+
+
+def allowed_shifts(nurses: List[str], num_days: int) -> Dict[Tuple[int, int], List[int]]:
+    """Return the shift indices each nurse may take on each day.
+
+    Applies the static rules H2 (nurse restrictions), H3 (clinic holidays)
+    and H10 (久保 only CT/2) so impossible assignments never become
+    variables.
+    """
+    night_idx = SHIFT_CODE["夜"]
+    outpatient_shifts = {
+        SHIFT_CODE[code] for code in ["1", "2", "3", "4", "CT", "F", "2/"] if code in SHIFT_CODE
+    }
+    banned: Dict[str, Set[int]] = {
+        "板川": {night_idx},
+        "三好": {night_idx},
+        "御書": {night_idx, SHIFT_CODE["早日"], SHIFT_CODE["残日"]} | outpatient_shifts,
+        "久保": {
+            s for s, code in enumerate(SHIFT_TYPES) if code not in ("CT", "2")
+        },
+    }
+    forbidden = holiday_forbidden_shifts(num_days)
+    allowed: Dict[Tuple[int, int], List[int]] = {}
+    for n, nurse in enumerate(nurses):
+        nurse_banned = banned.get(nurse, set())
+        for d in range(1, num_days + 1):
+            allowed[(n, d)] = [
+                s
+                for s in range(len(SHIFT_TYPES))
+                if s not in nurse_banned and (d, s) not in forbidden
+            ]
+    return allowed
+
+
+def create_shift_vars(
+    model: cp_model.CpModel, nurses: List[str], num_days: int
+) -> Dict[Tuple[int, int, int], BoolVar]:
+    """Create the assignment variables ``x[(nurse, day, shift)]``.
+
+    Only shifts returned by ``allowed_shifts`` become BoolVars; every other
+    entry is the constant 0, which is how H2, H3 and H10 are enforced.
+    Variables are left unnamed to skip formatting thousands of names.
+    """
+    allowed = allowed_shifts(nurses, num_days)
+    x: Dict[Tuple[int, int, int], BoolVar] = {}
+    for n in range(len(nurses)):
+        for d in range(1, num_days + 1):
+            allowed_nd = allowed[(n, d)]
+            for s in range(len(SHIFT_TYPES)):
+                if s in allowed_nd:
+                    x[(n, d, s)] = model.NewBoolVar("")
+                else:
+                    x[(n, d, s)] = model.NewConstant(0)
+    return x
+
+
 def build_hard_constraints(model: cp_model.CpModel, x: Dict[Tuple[int, int, int], BoolVar], data: Dict) -> None:
     """Add hard constraints H1-H13 to the CP-SAT model.
 
@@ -33,97 +111,63 @@ def build_hard_constraints(model: cp_model.CpModel, x: Dict[Tuple[int, int, int]
     """
     num_nurses = len(data["nurses"])
     num_days = data["num_days"]
-    num_shifts = len(data["shift_types"])
+    allowed = allowed_shifts(data["nurses"], num_days)
 
     # Indices for special shifts
     night_idx = SHIFT_CODE["夜"]
     off_idx = SHIFT_CODE["×"]
+    rest_idx = SHIFT_CODE["休"]
+    early_idx = SHIFT_CODE["早日"]
+    late_idx = SHIFT_CODE["残日"]
+    two_slash_idx = SHIFT_CODE["2/"]
 
     requests: pd.DataFrame | None = data.get("requests")
 
     # H1: Each nurse must have exactly one shift per day
     for n in range(num_nurses):
         for d in range(1, num_days + 1):
-            model.Add(sum(x[(n, d, s)] for s in range(num_shifts)) == 1)
+            model.AddExactlyOne([x[(n, d, s)] for s in allowed[(n, d)]])
     print("\u2714 H1: 1日1シフト制約を追加しました")
 
-    # H2: Nurse-specific restrictions
-    itagawa = data["nurses"].index("板川") if "板川" in data["nurses"] else None
-    miyoshi = data["nurses"].index("三好") if "三好" in data["nurses"] else None
-    goshyo = data["nurses"].index("御書") if "御書" in data["nurses"] else None
-    outpatient_shifts = [
-        SHIFT_CODE.get(code)
-        for code in ["1", "2", "3", "4", "CT", "F", "2/"]
-        if code in SHIFT_CODE
-    ]
-    early_idx = SHIFT_CODE.get("早日") if "早日" in SHIFT_CODE else data["shift_types"].index("早日")
-    late_idx = SHIFT_CODE.get("残日") if "残日" in SHIFT_CODE else data["shift_types"].index("残日")
-    for d in range(1, num_days + 1):
-        if itagawa is not None:
-            model.Add(x[(itagawa, d, night_idx)] == 0)
-        if miyoshi is not None:
-            model.Add(x[(miyoshi, d, night_idx)] == 0)
-        if goshyo is not None:
-            model.Add(x[(goshyo, d, night_idx)] == 0)
-            for s in outpatient_shifts:
-                model.Add(x[(goshyo, d, s)] == 0)
-            model.Add(x[(goshyo, d, early_idx)] == 0)
-            model.Add(x[(goshyo, d, late_idx)] == 0)
+    # H2: Nurse-specific restrictions are fixed to 0 when the variables are
+    # created, see ``allowed_shifts``.
     print("\u2714 H2: 看護師ごとの勤務制限を追加しました")
 
-    # H3: Clinic holidays (Thu/Sun closed, Sat half day)
-    weekdays = ["月", "火", "水", "木", "金", "土", "日"]
-    for d in range(1, num_days + 1):
-        wd = weekdays[(d - 1) % 7]
-        if wd in ("木", "日"):
-            allowed = {"夜", "早日", "残日", "休", "×"}
-            for s, code in enumerate(data["shift_types"]):
-                if code not in allowed:
-                    for n in range(num_nurses):
-                        model.Add(x[(n, d, s)] == 0)
-        elif wd == "土":
-            banned = {"1", "2", "3", "4", "CT", "F", "2/", "〇"}
-            for s, code in enumerate(data["shift_types"]):
-                if code in banned:
-                    for n in range(num_nurses):
-                        model.Add(x[(n, d, s)] == 0)
+    # H3: Clinic holidays (Thu/Sun closed, Sat half day) are likewise fixed
+    # to 0 at variable creation.
+    weekdays = month_weekdays(num_days)
     print("\u2714 H3: 定休日のシフト制限を追加しました")
 
     # H4: Outpatient/Ward allocation rules
     outpatient = {"1", "2", "3", "4", "CT", "F", "2/"}
     ward = {"〇"}
-    early_idx = SHIFT_CODE.get("早日") if "早日" in SHIFT_CODE else data["shift_types"].index("早日")
-    late_idx = SHIFT_CODE.get("残日") if "残日" in SHIFT_CODE else data["shift_types"].index("残日")
     for d in range(1, num_days + 1):
-        wd = weekdays[(d - 1) % 7]
+        wd = weekdays[d - 1]
         if wd in {"月", "火", "水", "金"}:
-            out_count = sum(
-                x[(n, d, SHIFT_CODE[code])] for n in range(num_nurses) for code in outpatient if code in SHIFT_CODE
+            out_count = cp_model.LinearExpr.Sum(
+                [x[(n, d, SHIFT_CODE[code])] for n in range(num_nurses) for code in outpatient if code in SHIFT_CODE]
             )
-            ward_count = sum(
-                x[(n, d, SHIFT_CODE[code])] for n in range(num_nurses) for code in ward if code in SHIFT_CODE
+            ward_count = cp_model.LinearExpr.Sum(
+                [x[(n, d, SHIFT_CODE[code])] for n in range(num_nurses) for code in ward if code in SHIFT_CODE]
             )
             model.Add(out_count >= 4)
             model.Add(ward_count >= 3)
         elif wd in {"木", "日"}:
-            model.Add(sum(x[(n, d, early_idx)] for n in range(num_nurses)) == 1)
-            model.Add(sum(x[(n, d, late_idx)] for n in range(num_nurses)) == 1)
+            model.AddExactlyOne([x[(n, d, early_idx)] for n in range(num_nurses)])
+            model.AddExactlyOne([x[(n, d, late_idx)] for n in range(num_nurses)])
         elif wd == "土":
-            two_slash_idx = SHIFT_CODE.get("2/") if "2/" in SHIFT_CODE else data["shift_types"].index("2/")
-            model.Add(sum(x[(n, d, two_slash_idx)] for n in range(num_nurses)) >= 1)
+            model.Add(cp_model.LinearExpr.Sum([x[(n, d, two_slash_idx)] for n in range(num_nurses)]) >= 1)
     print("\u2714 H4: 外来と病棟の割当ルールを追加しました")
 
-    # H5 already added earlier
-
     # H5: Exactly one night shift per day
     for d in range(1, num_days + 1):
-        model.Add(sum(x[(n, d, night_idx)] for n in range(num_nurses)) == 1)
+        model.AddExactlyOne([x[(n, d, night_idx)] for n in range(num_nurses)])
     print("\u2714 H5: 1日1名の夜勤制約を追加しました")
 
     # H6: After a night shift, the next day must be '×'
     for n in range(num_nurses):
         for d in range(1, num_days):
-            model.Add(x[(n, d, night_idx)] <= x[(n, d + 1, off_idx)])
+            model.AddImplication(x[(n, d, night_idx)], x[(n, d + 1, off_idx)])
     print("\u2714 H6: 夜勤翌日は \u00d7 を追加しました")
 
     # H7: Last month night shift -> first day off
@@ -136,50 +180,32 @@ def build_hard_constraints(model: cp_model.CpModel, x: Dict[Tuple[int, int, int]
         print("\u2714 H7: 前月夜勤者の初日\u00d7 を追加しました")
 
     # H8: Minimum rest days per nurse
-    rest_idx = SHIFT_CODE.get("休")
     for n in range(num_nurses):
         model.Add(
-            sum(x[(n, d, rest_idx)] for d in range(1, num_days + 1)) >= 4
+            cp_model.LinearExpr.Sum([x[(n, d, rest_idx)] for d in range(1, num_days + 1)]) >= 4
         )
     print("\u2714 H8: 最低休暇日数を追加しました")
 
     # H9: Respect shift requests (symbols already converted)
     if requests is not None:
-        for n, nurse in enumerate(data["nurses"]):
-            if nurse not in requests.index:
-                continue
-            for d in range(1, num_days + 1):
-                col = f"day_{d}"
-                if col not in requests.columns:
-                    continue
-                req_shift = requests.loc[nurse, col]
-                if pd.notna(req_shift) and req_shift in data["shift_types"]:
-                    req_idx = SHIFT_CODE[req_shift]
-                    model.Add(x[(n, d, req_idx)] == 1)
+        # Snapshot the requests once; missing nurses/days become NaN
+        req_cols = [f"day_{d}" for d in range(1, num_days + 1)]
+        req_arr = requests.reindex(index=data["nurses"], columns=req_cols).to_numpy()
+        for n in range(num_nurses):
+            for d_idx in range(num_days):
+                req_shift = req_arr[n, d_idx]
+                if isinstance(req_shift, str) and req_shift in SHIFT_CODE:
+                    model.Add(x[(n, d_idx + 1, SHIFT_CODE[req_shift])] == 1)
     print("\u2714 H9: 希望休を反映しました")
 
     # H10: 久保は CT と 2番 のみ担当可
+    # (fixed at variable creation together with H2/H3)
     kubo_idx = data["nurses"].index("久保") if "久保" in data["nurses"] else None
-    if kubo_idx is not None:
-        allowed_kubo = [SHIFT_CODE[code] for code in ["CT", "2"] if code in SHIFT_CODE]
-        for d in range(1, num_days + 1):
-            for s in range(num_shifts):
-                if s not in allowed_kubo:
-                    model.Add(x[(kubo_idx, d, s)] == 0)
     print("✔ H10: 久保はCTと2番のみ担当可を追加しました")
 
     # H11: 第2木曜午後は久保に /訪 を割当
     if kubo_idx is not None:
-        second_thu = None
-        weekday_list = ["月", "火", "水", "木", "金", "土", "日"]
-        thu_count = 0
-        for d in range(1, num_days + 1):
-            wd = weekday_list[(d - 1) % 7]
-            if wd == "木":
-                thu_count += 1
-                if thu_count == 2:
-                    second_thu = d
-                    break
+        second_thu = second_thursday(num_days)
         if second_thu is not None and "訪" in SHIFT_CODE:
             visit_idx = SHIFT_CODE["訪"]
             model.Add(x[(kubo_idx, second_thu, visit_idx)] == 1)
@@ -199,49 +225,58 @@ def build_hard_constraints(model: cp_model.CpModel, x: Dict[Tuple[int, int, int]
     print("✔ H12: 久保休暇時のCT代替担当者制約を追加しました")
 
 
-def solve_initial_model(request_csv_path: str | Path = REQUEST_CSV_PATH) -> pd.DataFrame:
-    """Solve the hard constraint model and return the initial schedule.
+def build_initial_model(
+    request_csv_path: str | Path = REQUEST_CSV_PATH,
+) -> Tuple[cp_model.CpModel, Dict[Tuple[int, int, int], BoolVar], Dict]:
+    """Build the CP-SAT model with all hard constraints applied.
 
-    This wrapper builds the CP-SAT model, applies all hard constraints and
-    attempts to find any feasible solution within ``SOLVER_TIMEOUT`` seconds.
-    The returned ``DataFrame`` always contains an entry for every nurse and day
-    even if the solver fails to find a solution so callers do not have to guard
-    against ``None``.
+    Returns the model, the assignment variables and the ``data`` dict passed
+    to ``build_hard_constraints`` so callers can add soft constraints on top.
     """
-    df_requests = parse_shift_requests(load_request_csv(request_csv_path))
-    df_requests.set_index("nurse", inplace=True)
+    df_requests = load_shift_requests(request_csv_path)
 
     model = cp_model.CpModel()
-
-    num_nurses = len(NURSES)
-    num_days = NUM_DAYS
-    num_shifts = len(SHIFT_TYPES)
-
-    x: Dict[Tuple[int, int, int], BoolVar] = {}
-    for n in range(num_nurses):
-        for d in range(1, num_days + 1):
-            for s in range(num_shifts):
-                x[(n, d, s)] = model.NewBoolVar(f"x_{n}_{d}_{s}")
+    x = create_shift_vars(model, NURSES, NUM_DAYS)
 
     data = {
         "nurses": NURSES,
-        "num_days": num_days,
+        "num_days": NUM_DAYS,
         "shift_types": SHIFT_TYPES,
         "requests": df_requests,
     }
 
     build_hard_constraints(model, x, data)
+    return model, x, data
+
+
+def solve_initial_model(
+    request_csv_path: str | Path = REQUEST_CSV_PATH,
+    write_temp: bool = False,
+) -> pd.DataFrame:
+    """Solve the hard constraint model and return the initial schedule.
+
+    This wrapper builds the CP-SAT model, applies all hard constraints and
+    attempts to find any feasible solution within ``SOLVER_TIMEOUT`` seconds.
+    The returned ``DataFrame`` always contains an entry for every nurse and day
+    even if the solver fails to find a solution so callers do not have to guard
+    against ``None``.  Pass ``write_temp=True`` to also dump the result to
+    ``temp_shift.csv`` for debugging.
+    """
+    model, x, _ = build_initial_model(request_csv_path)
+
+    num_nurses = len(NURSES)
+    num_days = NUM_DAYS
 
     solver = cp_model.CpSolver()
     solver.parameters.max_time_in_seconds = SOLVER_TIMEOUT
+    # Run CP-SAT as a multi-threaded portfolio instead of a single worker
+    solver.parameters.num_search_workers = SOLVER_NUM_WORKERS
+    solver.parameters.log_search_progress = False
     status = solver.Solve(model)
     print(f"Solver status: {solver.StatusName(status)}")
 
-    df_result = pd.DataFrame(
-        index=NURSES,
-        columns=[f"day_{d}" for d in range(1, num_days + 1)],
-        data="",
-    )
+    # Fill a plain object array and wrap it once instead of per-cell .loc writes
+    arr = np.full((num_nurses, num_days), "", dtype=object)
 
     if status in (cp_model.OPTIMAL, cp_model.FEASIBLE, cp_model.UNKNOWN):
         # Even if the status is UNKNOWN, the solver may return a feasible
@@ -250,8 +285,8 @@ def solve_initial_model(request_csv_path: str | Path = REQUEST_CSV_PATH) -> pd.D
             for d in range(1, num_days + 1):
                 assigned = False
                 for s, code in enumerate(SHIFT_TYPES):
-                    if solver.Value(x[(n, d, s)]):
-                        df_result.loc[nurse, f"day_{d}"] = code
+                    if solver.BooleanValue(x[(n, d, s)]):
+                        arr[n, d - 1] = code
                         assigned = True
                         break
                 if not assigned:
@@ -261,7 +296,14 @@ def solve_initial_model(request_csv_path: str | Path = REQUEST_CSV_PATH) -> pd.D
             f"No feasible solution found (status: {solver.StatusName(status)})."
         )
         # Fallback: assign all rest days to avoid invalid blanks
-        df_result.loc[:, :] = "休"
-    df_result.to_csv("temp_shift.csv", encoding="utf-8-sig")
+        arr[:] = "休"
+
+    df_result = pd.DataFrame(
+        arr,
+        index=NURSES,
+        columns=[f"day_{d}" for d in range(1, num_days + 1)],
+    )
+    if write_temp:
+        df_result.to_csv("temp_shift.csv", encoding="utf-8-sig")
 
     return df_result
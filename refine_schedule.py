@@ -2,18 +2,20 @@
 from pathlib import Path
 from typing import Dict, Tuple
 
+import numpy as np
 import pandas as pd
 from ortools.sat.python import cp_model
 
 from utils.constants import (
     NURSES,
     SHIFT_TYPES,
+    SHIFT_CODE,
     NUM_DAYS,
     NIGHT_SHIFT_PREFERRED,
     REQUEST_CSV_PATH,
+    SOLVER_NUM_WORKERS,
 )
-from utils.reader import load_request_csv, parse_shift_requests
-from initial_assignment import solve_initial_model, build_hard_constraints
+from initial_assignment import allowed_shifts, build_initial_model
 
 
 BoolVar = cp_model.IntVar
@@ -25,59 +27,61 @@ def add_soft_constraints(
     """Add soft constraints S1-S5 to the objective function."""
     num_nurses = len(data["nurses"])
     num_days = data["num_days"]
-    night_idx = data["shift_types"].index("夜")
-    rest_idx = data["shift_types"].index("休")
-    off_idx = data["shift_types"].index("×")
-    penalties = []
+    night_idx = SHIFT_CODE["夜"]
+    rest_idx = SHIFT_CODE["休"]
+    off_idx = SHIFT_CODE["×"]
+    four_idx = SHIFT_CODE.get("4")
+    # Penalty terms per soft constraint, weighted separately in the objective
+    pen_s1, pen_s2, pen_s3, pen_s4, pen_s5 = [], [], [], [], []
 
     # S1: Each nurse should have around 13 days off ("休" or "×")
     for n in range(num_nurses):
-        off_count = sum(x[(n, d, rest_idx)] for d in range(1, num_days + 1))
-        off_count += sum(x[(n, d, off_idx)] for d in range(1, num_days + 1))
+        off_count = cp_model.LinearExpr.Sum(
+            [x[(n, d, rest_idx)] for d in range(1, num_days + 1)]
+            + [x[(n, d, off_idx)] for d in range(1, num_days + 1)]
+        )
         diff = model.NewIntVar(0, num_days, f"off_diff_{n}")
         model.AddAbsEquality(diff, off_count - 13)
-        penalties.append(diff)
+        pen_s1.append(diff)
 
     # S2: Preferred night shift nurses should work about 5 night shifts
     for n, nurse in enumerate(data["nurses"]):
         if nurse in data.get("night_shift_preferred", []):
-            night_count = sum(x[(n, d, night_idx)] for d in range(1, num_days + 1))
+            night_count = cp_model.LinearExpr.Sum([x[(n, d, night_idx)] for d in range(1, num_days + 1)])
             diff_night = model.NewIntVar(0, num_days, f"night_diff_{n}")
             model.Add(night_count - 5 <= diff_night)
             model.Add(5 - night_count <= diff_night)
-            penalties.append(diff_night)
+            pen_s2.append(diff_night)
 
     # S3: Balance shift type counts overall (simple average target)
     total_slots = num_nurses * num_days
     avg_per_shift = total_slots // len(data["shift_types"])
     for s, code in enumerate(data["shift_types"]):
-        total = sum(x[(n, d, s)] for n in range(num_nurses) for d in range(1, num_days + 1))
+        total = cp_model.LinearExpr.Sum([x[(n, d, s)] for n in range(num_nurses) for d in range(1, num_days + 1)])
         diff_total = model.NewIntVar(0, total_slots, f"shift_diff_{s}")
         model.Add(total - avg_per_shift <= diff_total)
         model.Add(avg_per_shift - total <= diff_total)
-        penalties.append(diff_total)
+        pen_s3.append(diff_total)
 
     # S4: Workers with night shifts should have at least one "4" shift (logical variable version)
-    if "4" in data["shift_types"]:
-        four_idx = data["shift_types"].index("4")
+    if four_idx is not None:
         for n in range(num_nurses):
-            night_count = sum(x[(n, d, night_idx)] for d in range(1, num_days + 1))
-            four_count = sum(x[(n, d, four_idx)] for d in range(1, num_days + 1))
-            flag = model.NewBoolVar(f"four_penalty_{n}")
-
+            night_count = cp_model.LinearExpr.Sum([x[(n, d, night_idx)] for d in range(1, num_days + 1)])
+            four_count = cp_model.LinearExpr.Sum([x[(n, d, four_idx)] for d in range(1, num_days + 1)])
             has_night = model.NewBoolVar(f"has_night_{n}")
-            no_four = model.NewBoolVar(f"no_four_{n}")
-
             model.Add(night_count >= 1).OnlyEnforceIf(has_night)
-            model.Add(night_count < 1).OnlyEnforceIf(has_night.Not())
+            model.Add(night_count == 0).OnlyEnforceIf(has_night.Not())
 
-            model.Add(four_count == 0).OnlyEnforceIf(no_four)
-            model.Add(four_count != 0).OnlyEnforceIf(no_four.Not())
+            has_four = model.NewBoolVar(f"has_four_{n}")
+            model.Add(four_count >= 1).OnlyEnforceIf(has_four)
+            model.Add(four_count == 0).OnlyEnforceIf(has_four.Not())
 
-            model.AddBoolAnd([has_night, no_four]).OnlyEnforceIf(flag)
-            model.AddBoolOr([has_night.Not(), no_four.Not()]).OnlyEnforceIf(flag.Not())
+            # flag <=> has_night and not has_four
+            flag = model.NewBoolVar(f"four_penalty_{n}")
+            model.AddBoolAnd([has_night, has_four.Not()]).OnlyEnforceIf(flag)
+            model.AddBoolOr([has_night.Not(), has_four]).OnlyEnforceIf(flag.Not())
 
-            penalties.append(flag)
+            pen_s4.append(flag)
 
     # S5: Prefer not to deviate from the initial solution if provided
     if "initial_solution" in data:
@@ -85,12 +89,12 @@ def add_soft_constraints(
         for n, nurse in enumerate(data["nurses"]):
             for d in range(1, num_days + 1):
                 init_shift = init_df.loc[nurse, f"day_{d}"]
-                if init_shift in data["shift_types"]:
-                    idx = data["shift_types"].index(init_shift)
+                if init_shift in SHIFT_CODE:
+                    idx = SHIFT_CODE[init_shift]
                     diff_var = model.NewBoolVar(f"change_{n}_{d}")
                     model.Add(x[(n, d, idx)] == 0).OnlyEnforceIf(diff_var)
                     model.Add(x[(n, d, idx)] == 1).OnlyEnforceIf(diff_var.Not())
-                    penalties.append(diff_var)
+                    pen_s5.append(diff_var)
 
     # ソフト制約ごとの重みを設定
     w1 = 3
@@ -99,65 +103,65 @@ def add_soft_constraints(
     w4 = 2
     w5 = 1
 
-    weighted_penalties = (
-        sum(penalties[:num_nurses]) * w1 +  # S1: 休み
-        sum(penalties[num_nurses:num_nurses * 2]) * w2 +  # S2: 夜勤希望
-        sum(penalties[num_nurses * 2:num_nurses * 2 + len(data["shift_types"])]) * w3 +  # S3: シフト種
-        sum(p for p in penalties if isinstance(p, cp_model.IntVar) and "four_penalty" in p.Name()) * w4 +  # S4
-        sum(p for p in penalties if isinstance(p, cp_model.IntVar) and "change_" in p.Name()) * w5  # S5
+    weighted_penalties = cp_model.LinearExpr.WeightedSum(
+        pen_s1 + pen_s2 + pen_s3 + pen_s4 + pen_s5,
+        [w1] * len(pen_s1)  # S1: 休み
+        + [w2] * len(pen_s2)  # S2: 夜勤希望
+        + [w3] * len(pen_s3)  # S3: シフト種
+        + [w4] * len(pen_s4)  # S4
+        + [w5] * len(pen_s5),  # S5
     )
     model.Minimize(weighted_penalties)
 
 
 def optimize_final_schedule(
     request_csv_path: Path | str = REQUEST_CSV_PATH,
+    initial_df: pd.DataFrame | None = None,
 ) -> pd.DataFrame:
-    """Optimize the final schedule considering soft constraints."""
-    initial_df = solve_initial_model(request_csv_path)
-
-    df_requests = parse_shift_requests(load_request_csv(request_csv_path))
-    df_requests.set_index("nurse", inplace=True)
+    """Optimize the final schedule considering soft constraints.
 
-    model = cp_model.CpModel()
+    The hard and soft constraints are built into a single model and solved
+    once.  If a prior schedule ``initial_df`` is given, deviations from it are
+    penalized (S5) and its assignments are passed to CP-SAT as search hints.
+    """
+    model, x, data = build_initial_model(request_csv_path)
 
     num_nurses = len(NURSES)
     num_days = NUM_DAYS
-    num_shifts = len(SHIFT_TYPES)
 
-    x: Dict[Tuple[int, int, int], BoolVar] = {}
-    for n in range(num_nurses):
-        for d in range(1, num_days + 1):
-            for s in range(num_shifts):
-                x[(n, d, s)] = model.NewBoolVar(f"x_{n}_{d}_{s}")
-
-    data = {
-        "nurses": NURSES,
-        "num_days": num_days,
-        "shift_types": SHIFT_TYPES,
-        "requests": df_requests,
-        "night_shift_preferred": NIGHT_SHIFT_PREFERRED,
-        "initial_solution": initial_df,
-    }
-
-    build_hard_constraints(model, x, data)
+    data["night_shift_preferred"] = NIGHT_SHIFT_PREFERRED
+    if initial_df is not None:
+        data["initial_solution"] = initial_df
+
     add_soft_constraints(model, x, data)
 
+    if initial_df is not None:
+        # Warm start: hints are advisory only, unlike S5 they never restrict
+        # search.  Cells fixed to the constant 0 must not be hinted.
+        allowed = allowed_shifts(NURSES, num_days)
+        for n, nurse in enumerate(NURSES):
+            for d in range(1, num_days + 1):
+                code = initial_df.loc[nurse, f"day_{d}"]
+                if code in SHIFT_CODE and SHIFT_CODE[code] in allowed[(n, d)]:
+                    model.AddHint(x[(n, d, SHIFT_CODE[code])], 1)
+
     solver = cp_model.CpSolver()
     solver.parameters.max_time_in_seconds = 10
+    # Parallel portfolio search; stop once within 1% of the best bound
+    solver.parameters.num_search_workers = SOLVER_NUM_WORKERS
+    solver.parameters.log_search_progress = False
+    solver.parameters.relative_gap_limit = 0.01
     status = solver.Solve(model)
 
-    df_result = pd.DataFrame(
-        index=NURSES,
-        columns=[f"day_{d}" for d in range(1, num_days + 1)],
-        data="",
-    )
+    day_cols = [f"day_{d}" for d in range(1, num_days + 1)]
+    arr = np.full((num_nurses, num_days), "", dtype=object)
 
     if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-        for n, nurse in enumerate(NURSES):
+        for n in range(num_nurses):
             for d in range(1, num_days + 1):
                 for s, code in enumerate(SHIFT_TYPES):
-                    if solver.Value(x[(n, d, s)]):
-                        df_result.loc[nurse, f"day_{d}"] = code
+                    if solver.BooleanValue(x[(n, d, s)]):
+                        arr[n, d - 1] = code
                         break
     else:
         # If optimization failed, keep the initial solution or fill rests
@@ -165,8 +169,8 @@ def optimize_final_schedule(
             f"Final optimization failed (status: {solver.StatusName(status)})."
         )
         if initial_df is not None:
-            df_result[:] = initial_df
+            arr[:] = initial_df.reindex(index=NURSES, columns=day_cols).to_numpy()
         else:
-            df_result.loc[:, :] = "休"
+            arr[:] = "休"
 
-    return df_result
+    return pd.DataFrame(arr, index=NURSES, columns=day_cols)
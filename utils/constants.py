@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 """Constants for nurse scheduling."""
 
+import os
+from functools import lru_cache
 from pathlib import Path
+from typing import Tuple
 
 # Base directory of the project
 BASE_DIR = Path(__file__).resolve().parents[1]
@@ -54,6 +57,25 @@ SHIFT_TYPES = [
 # Mapping from shift code string to its index for safety
 SHIFT_CODE = {code: idx for idx, code in enumerate(SHIFT_TYPES)}
 
+# 曜日 (1日目の曜日を first_wd で指定、0 = 月曜)
+WEEKDAYS = ["月", "火", "水", "木", "金", "土", "日"]
+
+
+@lru_cache(maxsize=None)
+def month_weekdays(num_days: int, first_wd: int = 0) -> Tuple[str, ...]:
+    """Return the weekday name of each day, index 0 being day 1."""
+    return tuple(WEEKDAYS[(i + first_wd) % 7] for i in range(num_days))
+
+
+@lru_cache(maxsize=None)
+def second_thursday(num_days: int, first_wd: int = 0) -> int | None:
+    """Return the day number of the second Thursday, or None if absent."""
+    thursdays = [
+        d for d, wd in enumerate(month_weekdays(num_days, first_wd), start=1) if wd == "木"
+    ]
+    return thursdays[1] if len(thursdays) > 1 else None
+
+
 # 曜日ごとの休み設定
 # 木・日: 全休, 土: 午後休
 HOLIDAY_MAP = {
@@ -78,3 +100,6 @@ OUTPUT_EXCEL_PATH = BASE_DIR / "shift_output.xlsx"
 
 # Solver time limit in seconds
 SOLVER_TIMEOUT = 10
+
+# Number of CP-SAT portfolio workers (parallel search with clause sharing)
+SOLVER_NUM_WORKERS = max(8, os.cpu_count() or 8)
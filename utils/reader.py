@@ -1,3 +1,5 @@
+import os
+from functools import lru_cache
 from pathlib import Path
 import pandas as pd
 
@@ -23,5 +25,26 @@ def load_request_csv(path: Path | str) -> pd.DataFrame:
 
 def parse_shift_requests(df: pd.DataFrame) -> pd.DataFrame:
     """Convert request symbols like ①~⑥ into internal codes."""
-    mapping = {"①": "休", "②": "休", "③": "休", "④": "休", "⑤": "休", "⑥": "休"}
-    return df.replace(mapping)
+    request_symbols = ["①", "②", "③", "④", "⑤", "⑥"]
+    day_cols = [c for c in df.columns if c.startswith("day_")]
+    df = df.copy()
+    # Mask and overwrite only the day columns instead of a frame-wide replace
+    vals = df[day_cols].to_numpy()
+    vals[df[day_cols].isin(request_symbols).to_numpy()] = "休"
+    df[day_cols] = vals
+    return df
+
+
+@lru_cache(maxsize=4)
+def _load_and_parse(path_str: str, mtime: float) -> pd.DataFrame:
+    """Parse the request CSV once per file version (``mtime`` is the cache key)."""
+    return parse_shift_requests(load_request_csv(path_str)).set_index("nurse")
+
+
+def load_shift_requests(path: Path | str) -> pd.DataFrame:
+    """Return the parsed requests indexed by nurse name.
+
+    The result is cached on path and modification time and shared between
+    callers, so it must be treated as read-only.
+    """
+    return _load_and_parse(str(path), os.path.getmtime(path))
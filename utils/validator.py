@@ -2,6 +2,7 @@
 
 from typing import List
 
+import numpy as np
 import pandas as pd
 
 from .constants import SHIFT_TYPES
@@ -24,23 +25,21 @@ def validate_constraints(assignments: pd.DataFrame) -> List[str]:
     violations: List[str] = []
 
     day_numbers = [int(col.split("_")[1]) for col in assignments.columns]
-    max_day = max(day_numbers)
-
-    for nurse in assignments.index:
-        for col in assignments.columns:
-            shift = assignments.loc[nurse, col]
-            if shift not in SHIFT_TYPES:
-                violations.append(
-                    f"Invalid shift '{shift}' for {nurse} on {col}"
-                )
-
-        for day in day_numbers:
-            if assignments.loc[nurse, f"day_{day}"] == "夜" and day < max_day:
-                next_shift = assignments.loc[nurse, f"day_{day + 1}"]
-                if next_shift != "×":
-                    violations.append(
-                        f"Night shift not followed by '×' for {nurse} on day {day + 1}"
-                    )
+    nurses = assignments.index
+    arr = assignments.to_numpy()
+
+    invalid = ~assignments.isin(SHIFT_TYPES).to_numpy()
+    for i, j in np.argwhere(invalid):
+        violations.append(
+            f"Invalid shift '{arr[i, j]}' for {nurses[i]} on {assignments.columns[j]}"
+        )
+
+    # A night shift on day d must be followed by '×' on day d + 1
+    bad_rest = (arr[:, :-1] == "夜") & (arr[:, 1:] != "×")
+    for i, j in np.argwhere(bad_rest):
+        violations.append(
+            f"Night shift not followed by '×' for {nurses[i]} on day {day_numbers[j + 1]}"
+        )
 
     return violations
 
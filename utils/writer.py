@@ -3,7 +3,7 @@ from pathlib import Path
 from typing import Any
 
 import pandas as pd
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
 from openpyxl.worksheet.worksheet import Worksheet
 
 
@@ -30,25 +30,46 @@ def fill_shift_cells(ws: Worksheet, assignments: pd.DataFrame) -> None:
     start_row = 6
     nurse_rows = list(range(start_row, start_row + len(assignments.index)))
     nurse_names_in_excel = [ws.cell(row=r, column=1).value for r in nurse_rows]
+    row_of = {
+        name: r for r, name in zip(nurse_rows, nurse_names_in_excel) if name is not None
+    }
 
     # Day columns in the result (max 31 days). Excel columns start at C (index 3)
     col_offset = 3
-    date_cols = assignments.columns.tolist()[:31]
+    num_cols = min(31, assignments.shape[1])
+    # Materialize once so the inner loop avoids pandas label lookups
+    values = assignments.to_numpy()
 
-    for nurse in assignments.index:
-        if nurse not in nurse_names_in_excel:
+    for i, nurse in enumerate(assignments.index):
+        row_idx = row_of.get(nurse)
+        if row_idx is None:
             # Skip nurses not present in the template
             continue
-        row_idx = nurse_names_in_excel.index(nurse) + start_row
-        for j, day_col in enumerate(date_cols):
-            shift = assignments.at[nurse, day_col]
-            ws.cell(row=row_idx, column=col_offset + j, value=shift)
+        # Write the whole day block of this row at once
+        (row_cells,) = ws.iter_rows(
+            min_row=row_idx,
+            max_row=row_idx,
+            min_col=col_offset,
+            max_col=col_offset + num_cols - 1,
+        )
+        for cell, shift in zip(row_cells, values[i, :num_cols]):
+            cell.value = shift
+
+
+def load_template(template_path: Path | str = TEMPLATE_PATH) -> Workbook:
+    """Load the Excel template workbook.
+
+    The template carries styles and date/count formulas that must survive,
+    so it is loaded in normal mode (not read_only, write_only or data_only).
+    """
+    return load_workbook(str(template_path))
 
 
 def write_to_excel(
     df_result: pd.DataFrame,
     output_path: Path | str,
     template_path: Path | str = TEMPLATE_PATH,
+    workbook: Workbook | None = None,
 ) -> None:
     """Write the optimized schedule to an Excel file based on a template.
 
@@ -61,8 +82,11 @@ def write_to_excel(
         Path to save the resulting Excel file.
     template_path : str, optional
         Path to the Excel template, by default ``data/shift_template.xlsx``.
+    workbook : openpyxl.Workbook, optional
+        Template workbook that was already loaded with ``load_template``.
+        When given, ``template_path`` is ignored.
     """
-    wb = load_workbook(str(template_path))
+    wb = workbook if workbook is not None else load_template(template_path)
     ws = wb["シフト表"]
     fill_shift_cells(ws, df_result)
     wb.save(str(output_path))